@@ -1,10 +1,13 @@
 import numpy as np
 import math
 import random
+import threading
+from collections import OrderedDict
 from prompt_toolkit.formatted_text.utils import fragment_list_len
 from statsmodels.tsa.stattools import adfuller
 from scipy.signal import find_peaks
 import dtw as DTW
+from pearson import Pearson
 
 class CETS():
   """
@@ -23,7 +26,9 @@ class CETS():
   def __init__(self, time_series, event_sequences, 
                 sub_length = 0, ts_ratio= 1, acf_ratio = 16, 
                 adf_ratio = 64, width_ratio = 0.5, sub_len_max = 100, 
-                sub_len_min = 20, r = 3, alpha = 1.96, nn_dis_threshold = 0.0025):
+                sub_len_min = 20, r = 3, alpha = 1.96, nn_dis_threshold = 0.0025,
+                cache_dist = False, cache_size = 100000, bg_pool_size = 0, seed = None,
+                screen = None, screen_threshold = 1.0):
     """
       time_series     : list of multivariate time series.
       event_sequences : list of event_sequences.
@@ -42,6 +47,29 @@ class CETS():
       nn_dis_threshold  : nearest neighbor distance threshold. if distance
                           between two series is smaller than this value, they
                           are regarded as same value.
+      cache_dist        : keep DTW distances between sub-series in memory and
+                          reuse them when the same pair is compared again.
+      cache_size        : maximum number of cached distances. least recently
+                          used distances are evicted beyond this size.
+      bg_pool_size      : size of background pool of random sub-series built
+                          once per (time series, dim, sub_length) with its
+                          distance matrix. random samples of each event are
+                          drawn from the pool. 0 for a fresh random sample.
+                          must not be smaller than the number of events.
+      seed              : random seed for random samples and background pools.
+                          each sample is seeded from (seed, pool key, event),
+                          so results do not depend on test order.
+                          None for global np.random.
+      screen            : cheap screen run over all dims before the DTW test.
+                          None for no screen, 'effect' for mean/variance shift
+                          between front and rear sub-series, 'pearson' for
+                          pearson correlation coefficient with event.
+      screen_threshold  : dims with screen score below this value are not
+                          tested. 'effect' score is root mean square of Welch
+                          t-score of means and z-score of log variance ratio,
+                          'pearson' score is sqrt(n)*|coefficient|. both are
+                          scale free and about 1 for uncorrelated i.i.d. dims,
+                          so default 1.0 keeps about a third of them.
     """
     self.time_series = self.normalize_time_series(time_series)
     self.event_sequences = event_sequences
@@ -51,11 +79,24 @@ class CETS():
     self.r = r
     self.alpha = alpha
     self.nn_dis_threshold = nn_dis_threshold
+    self.dist_cache = OrderedDict() if cache_dist else None
+    self.cache_size = cache_size
+    self.cache_lock = threading.Lock()
+    self.bg_pool_size = bg_pool_size
+    self.bg_pools = {}    # (pool, distance matrix) for each pool key
+    self.pool_locks = {}  # lock for each pool being built
+    self.seed = seed
+    if screen not in (None, 'effect', 'pearson'):
+      raise ValueError("screen must be None, 'effect' or 'pearson'.")
+    self.screen = screen
+    self.screen_threshold = screen_threshold
+    self.screen_output = None   # screen result in output format of run_cets
+    self.n_skipped = 0          # number of tests skipped by screen
 
   # initialize sub-series length
   def init_sub_length(self, sub_length, ts_ratio, acf_ratio, adf_ratio, width_ratio):
     if sub_length > 0:
-      return [[sub_length] * len(self.time_series[i].shape[1]) 
+      return [[sub_length] * self.time_series[i].shape[1] 
                 for i in range(len(self.time_series))]
       
     elif sub_length == 0:
@@ -121,7 +162,8 @@ class CETS():
 
 
   # two-sample hypothesis test with Nearest Neighbor algorithm
-  def two_sample_test_with_NN(self, sample0, sample1, r, alpha = 1.96):
+  # dist is optional precomputed distance matrix of the pooled sample.
+  def two_sample_test_with_NN(self, sample0, sample1, r, alpha = 1.96, dist = None):
     pooled_sample = sample0 + sample1   # pooled sample Z
     n0, n1 = len(sample0), len(sample1)
     p = n0 + n1
@@ -131,7 +173,7 @@ class CETS():
 
     T_rp = 0
     for i in range(p):
-      ind = self.NN_indicator_with_DTW(i, pooled_sample, n0, p, r)
+      ind = self.NN_indicator_with_DTW(i, pooled_sample, n0, p, r, dist)
       T_rp += ind
     T_rp = T_rp / r / p
 
@@ -144,14 +186,17 @@ class CETS():
 
   # Ir(x, A1, A2) =   1, if x ∈ Ai && NNr(x, A) ∈ Ai,
   #                   0, otherwise.
-  def NN_indicator_with_DTW(self, i, Z, n0, p, r):
+  def NN_indicator_with_DTW(self, i, Z, n0, p, r, dist = None):
     x = Z[i]
     dists = []    # list for distances
     ind = 0       # indicator
 
     for j in range(p):
       if j != i:
-        dists.append((j, DTW.dtw(x, Z[j], keep_internals=True).distance))
+        if dist is None:
+          dists.append((j, self.dtw_distance(x, Z[j])))
+        else:
+          dists.append((j, dist[i][j]))
 
     dists.sort(key = lambda element : element[1])
     if (dists[-1][1] - dists[0][1]) / 2 / len(x) < self.nn_dis_threshold:
@@ -165,6 +210,66 @@ class CETS():
     return ind
 
 
+  # DTW distance between two sub-series
+  # distances are memoized by content in LRU cache when dist_cache is enabled.
+  def dtw_distance(self, x, y):
+    if self.dist_cache is None:
+      return DTW.dtw(x, y, keep_internals=True).distance
+
+    hx, hy = hash(np.asarray(x).tobytes()), hash(np.asarray(y).tobytes())
+    key = (hx, hy) if hx <= hy else (hy, hx)
+    with self.cache_lock:
+      if key in self.dist_cache:
+        self.dist_cache.move_to_end(key)
+        return self.dist_cache[key]
+
+    distance = DTW.dtw(x, y, keep_internals=True).distance
+    with self.cache_lock:
+      self.dist_cache[key] = distance
+      while len(self.dist_cache) > self.cache_size:
+        self.dist_cache.popitem(last=False)
+
+    return distance
+
+
+  # distance matrix of pooled sample of sample0 and sample1
+  # dist1 is optional precomputed distance matrix of sample1.
+  def pooled_distance_matrix(self, sample0, sample1, dist1 = None):
+    pooled_sample = sample0 + sample1
+    n0, p = len(sample0), len(pooled_sample)
+    dist = np.zeros((p, p))
+
+    for i in range(p):
+      for j in range(i+1, p):
+        if dist1 is not None and i >= n0:
+          dist[i][j] = dist1[i-n0][j-n0]
+        else:
+          dist[i][j] = self.dtw_distance(pooled_sample[i], pooled_sample[j])
+        dist[j][i] = dist[i][j]
+
+    return dist
+
+  # random generator seeded from (seed, *key), global np.random for no seed
+  def random_state(self, *key):
+    if self.seed is None:
+      return np.random
+    return np.random.RandomState([self.seed] + [int(v) % (2**32) for v in key])
+
+  # background pool of random sub-series of length k for a pool key
+  # built once with its distance matrix, and cached.
+  def background_pool(self, series, k, pool_key):
+    with self.cache_lock:
+      lock = self.pool_locks.setdefault(pool_key, threading.Lock())
+
+    with lock:
+      if pool_key not in self.bg_pools:
+        rng = self.random_state(*pool_key)
+        pool = [rng.choice(series, k, False) for _ in range(self.bg_pool_size)]
+        self.bg_pools[pool_key] = (pool, self.pooled_distance_matrix([], pool))
+
+    return self.bg_pools[pool_key]
+
+
   # test effect type
   def effect_type_test(self, sample0, sample1, alpha = 1.96):
     effect_type = 0   # offect type = 0 for none, 1 for positive, 2 for negative
@@ -206,20 +311,94 @@ class CETS():
     if R:
       print("{0} {1} {2}".format(name0, cor_type, name1))
 
+  # screen score of mean/variance shift between front and rear sub-series
+  # for all dims. root mean square of Welch t-score of means and z-score of
+  # log variance ratio, which does not depend on scale of the series.
+  def effect_screen(self, ts, event, sub_lengths):
+    score = np.zeros(ts.shape[1])
+    sub_lengths = np.asarray(sub_lengths)
+
+    # dims with same sub-series length are screened together
+    for k in np.unique(sub_lengths):
+      dims = np.where(sub_lengths == k)[0]
+      ev = np.asarray([e for e in event if e >= k and e+k < len(ts)], dtype=int)
+      if len(ev) == 0:
+        continue
+
+      ts_dims = ts[:, dims]
+      front = ts_dims[ev[:,None] + np.arange(-k, 0)]
+      rear = ts_dims[ev[:,None] + np.arange(1, k+1)]
+      m0, m1 = np.mean(front, axis=(0,1)), np.mean(rear, axis=(0,1))
+      var0, var1 = np.var(front, axis=(0,1)), np.var(rear, axis=(0,1))
+
+      n = len(ev) * k   # values in front (rear) sub-series
+
+      with np.errstate(divide='ignore', invalid='ignore'):
+        # Welch t-score of mean shift
+        t_mean = np.where(var0 + var1 > 0, (m0 - m1) / np.sqrt((var0 + var1) / n),
+                          np.where(m0 != m1, np.inf, 0))
+        # z-score of log variance ratio, var(ln var) ~ 2/(n-1) for each side
+        t_var = np.where(var0 * var1 > 0, np.log(var1 / var0) / np.sqrt(4 / (n - 1)),
+                          np.where(var0 != var1, np.inf, 0))
+
+      score[dims] = np.sqrt((t_mean*t_mean + t_var*t_var) / 2)
+
+    return score
+
+  # screen score of pearson correlation coefficient with event for all dims
+  # sqrt(n)*|coefficient| is ~|N(0, 1)| for dims not correlated with event.
+  def pearson_screen(self, ts, event):
+    ev_ts = np.zeros(len(ts))
+    ev_ts[np.asarray(event, dtype=int)] = 1
+
+    return np.sqrt(len(ts)) * np.abs(Pearson.pearson_coefficient(ts, ev_ts))
+
+  # screen all dims of i-th time series for each event
+  # returns boolean array of shape (dims, events), True for dims to test.
+  def screen_time_series(self, i):
+    ts = self.time_series[i]
+    passed = np.zeros((ts.shape[1], len(self.event_sequences[i])), dtype=bool)
+
+    for k, event in enumerate(self.event_sequences[i]):
+      if self.screen == 'pearson':
+        score = self.pearson_screen(ts, event)
+      else:
+        score = self.effect_screen(ts, event, self.sub_length_list[i])
+      passed[:, k] = score > self.screen_threshold
+
+    return passed
+
   # run CETS for each time_series and event
+  # with screen, dims which do not pass the screen are regarded as not
+  # correlated without the test. screen result is kept in screen_output.
   def run_cets(self):
     output_list = []
+    screen_list = []
+    self.n_skipped = 0
+    n_test = 0
 
     for i in range(len(self.time_series)):
       output_each_ts = []
+      passed = None
+      if self.screen is not None:
+        passed = self.screen_time_series(i)
+        screen_list.append([[[bool(P), (False, False), -1] for P in passed_dim]
+                              for passed_dim in passed])
 
       for j in range(self.time_series[i].shape[1]):
         output_each_dim = []
 
         for k in range(len(self.event_sequences[i])):
+          n_test += 1
+          if passed is not None and not passed[j][k]:
+            self.n_skipped += 1
+            output_each_dim.append([False, (False, False), -1])
+            continue
+
           R, D, T = self.cets_one_series_and_event(self.time_series[i][:,j], 
                                           self.event_sequences[i][k],
-                                          self.sub_length_list[i][j])
+                                          self.sub_length_list[i][j],
+                                          (i, j, self.sub_length_list[i][j]))
           self.verbose_test_result('Time-series X{0} dim {1}'.format(i+1, j+1), 
                                     'Effect {0}'.format(k+1), R, T)
           output_each_dim.append([R, D, T])
@@ -228,11 +407,17 @@ class CETS():
 
       output_list.append(output_each_ts)
 
+    if self.screen is not None:
+      self.screen_output = screen_list
+      print("Screen '{0}': skipped {1} of {2} tests".format(self.screen, 
+                                                self.n_skipped, n_test))
+
     return output_list
 
 
   # actually run CETS algorithm
-  def cets_one_series_and_event(self, series, event, k):
+  # pool_key = (i, j, k) identifies background pool of i-th time series dim j.
+  def cets_one_series_and_event(self, series, event, k, pool_key = None):
     front_sub_series = []   # front sub-series set
     rear_sub_series = []    # rear sub-series set
     rand_sub_series = []    # randomly sampled sub-series set from S
@@ -252,13 +437,34 @@ class CETS():
     for e in event:
       front_sub_series.append(series[e-k:e])
       rear_sub_series.append(series[e+1:e+k+1])
-      rand_sub_series.append(np.random.choice(series, k, False))
+
+    # random sample of each event is drawn independently of other tests
+    if pool_key is None:
+      pool_key = (hash(series.tobytes()), k)
+    rng = self.random_state(*pool_key, *event)
+
+    if self.bg_pool_size > 0:
+      # draw random sample from background pool
+      if self.bg_pool_size < len(event):
+        raise ValueError('bg_pool_size ({0}) must not be smaller than the '
+                          'number of events ({1}).'.format(self.bg_pool_size, len(event)))
+      pool, pool_dist = self.background_pool(series, k, pool_key)
+      idx = rng.choice(len(pool), len(event), False)
+      rand_sub_series = [pool[i] for i in idx]
+      rand_dist = pool_dist[np.ix_(idx, idx)]
+
+      dist_f = self.pooled_distance_matrix(front_sub_series, rand_sub_series, rand_dist)
+      dist_r = self.pooled_distance_matrix(rear_sub_series, rand_sub_series, rand_dist)
+    else:
+      for e in event:
+        rand_sub_series.append(rng.choice(series, k, False))
+      dist_f, dist_r = None, None
 
     # test front sub-series with random sample
     D_f = self.two_sample_test_with_NN(front_sub_series, rand_sub_series,
-                                        self.r, self.alpha)
+                                        self.r, self.alpha, dist_f)
     D_r = self.two_sample_test_with_NN(rear_sub_series, rand_sub_series, 
-                                        self.r, self.alpha)
+                                        self.r, self.alpha, dist_r)
 
     if D_r and (not D_f):
       R = True
@@ -1,7 +1,11 @@
 import numpy as np
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from matplotlib import pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
 
 class DataLoader():
   def __init__(self, dataset_folder):
@@ -23,6 +27,20 @@ class DataLoader():
 
     return time_series
 
+  # list machine names (file names without .txt) of a category
+  def list_machines(self, category):
+    path = os.path.join(self.dataset_folder, category)
+    return sorted(f[:-len('.txt')] for f in os.listdir(path) if f.endswith('.txt'))
+
+  # load time series of a single machine (e.g. 'machine-1-1')
+  # only machines listed in the category folder can be loaded.
+  def load_time_series_of_machine(self, category, machine):
+    if machine not in self.list_machines(category):
+      raise FileNotFoundError('machine {0} not found in {1}.'.format(machine, category))
+    path = os.path.join(self.dataset_folder, category, machine + '.txt')
+
+    return np.genfromtxt(path, dtype=np.float32, delimiter=',')
+
   # load events in label format
   def load_events_in_label_format(self, category, interpret_label, correlat_type):
     path = os.path.join(self.dataset_folder, category)
@@ -137,10 +155,29 @@ class DataLoader():
 
 
 class DataPlotter():
-  def __init__(self, figsize, x_visible, x_len):
+  def __init__(self, figsize, x_visible, x_len, n_points = 0, downsample = 'lttb',
+                file_height = None):
+    """
+      figsize     : figure size.
+      x_visible   : show x axis or not.
+      x_len       : plot first x_len time points.
+      n_points    : number of points drawn per series. 0 for plotting every
+                    raw sample, otherwise each series is downsampled to about
+                    n_points (e.g. screen width in pixels) keeping its shape.
+      downsample  : 'lttb' for Largest-Triangle-Three-Buckets,
+                    'minmax' for min and max of each bucket.
+      file_height : height (inch) of each file of save_time_series_with_events.
+                    None for height of one subplot, figsize height divided
+                    by number of time series.
+    """
     self.figsize = figsize
     self.x_visible = x_visible
     self.x_len = x_len
+    self.n_points = n_points
+    if downsample not in ('lttb', 'minmax'):
+      raise ValueError("downsample must be 'lttb' or 'minmax'.")
+    self.downsample = downsample
+    self.file_height = file_height
 
   # plot time series
   def plt_time_series(self, time_series):
@@ -149,6 +186,11 @@ class DataPlotter():
     for i in range(len(time_series)):
       ts = time_series[i]
       plt.subplot(len(time_series), 1, i+1) 
+
+      if self.n_points > 0:
+        self.draw_downsampled(plt.gca(), i, ts)
+        continue
+
       plt.xlim([0, self.x_len])
       plt.gca().axes.xaxis.set_visible(self.x_visible)
       plt.ylabel('X' + str(i+1), labelpad=15, fontdict={'size': 18})
@@ -170,6 +212,11 @@ class DataPlotter():
     for i in range(len(time_series)):
       ts = time_series[i]
       evs = event_sequences[i]
+      plt.subplot(len(time_series), 1, i+1)
+
+      if self.n_points > 0:
+        self.draw_downsampled(plt.gca(), i, ts, evs)
+        continue
       
       # convert event to time series
       ev_ts = np.zeros(len(time_series[i]))
@@ -177,7 +224,6 @@ class DataPlotter():
         for et in ev:
           ev_ts[et] = 1
 
-      plt.subplot(len(time_series), 1, i+1)
       plt.xlim([0, self.x_len])
       plt.gca().axes.xaxis.set_visible(self.x_visible)
       plt.ylabel('X' + str(i+1), labelpad=15, fontdict={'size': 18})
@@ -192,6 +238,121 @@ class DataPlotter():
 
     plt.show()
 
-    
 
+  # render each time series (with events) off-screen to its own file
+  # files are rendered in parallel with a process pool.
+  def save_time_series_with_events(self, time_series, event_sequences,
+                                    filenames, workers = None):
+    if event_sequences is None:
+      event_sequences = [None] * len(time_series)
+    height = self.file_height
+    if height is None:
+      height = self.figsize[1] / len(time_series)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+      list(executor.map(self.save_one_time_series, range(len(time_series)),
+                        time_series, event_sequences, filenames,
+                        [height] * len(time_series)))
+
+    return filenames
+
+  # render one time series off-screen without pyplot
+  def save_one_time_series(self, i, ts, evs, filename, height):
+    fig = Figure(figsize=(self.figsize[0], height))
+    FigureCanvasAgg(fig)
+    self.draw_downsampled(fig.add_subplot(1, 1, 1), i, ts, evs)
+    fig.savefig(filename, bbox_inches='tight')
+
+
+  # draw downsampled dimension groups and events on an axes
+  def draw_downsampled(self, ax, i, ts, evs = None):
+    ts = ts[:self.x_len]
+    n_points = self.n_points if self.n_points > 0 else len(ts)
+
+    ax.set_xlim([0, self.x_len])
+    ax.xaxis.set_visible(self.x_visible)
+    ax.set_ylabel('X' + str(i+1), labelpad=15, fontdict={'size': 18})
+    ax.set_yticks([np.min(ts), np.max(ts)])
+    ax.tick_params(axis='y', labelsize=12)
+
+    # plot data, one line collection per dimension group
+    for cols, color in [(slice(None, 9), 'lightgray'), (slice(10, 19), 'darkgray'),
+                        (slice(20, 29), 'dimgray'), (slice(30, None), 'k')]:
+      group = ts[:, cols]
+      if group.shape[1] == 0:
+        continue
+
+      if self.downsample == 'lttb':
+        x, y = self.downsample_lttb(group, n_points)
+      else:
+        x, y = self.downsample_minmax(group, n_points)
+      segments = np.stack([x, y], axis=-1).transpose(1, 0, 2)
+      ax.add_collection(LineCollection(segments, colors=color))
+
+    # plot events as vertical lines
+    if evs is not None and len(evs) > 0:
+      ev_idx = np.unique(np.concatenate([np.asarray(ev, dtype=int) for ev in evs]))
+      ev_idx = ev_idx[ev_idx < self.x_len]
+      ax.vlines(ev_idx, 0, 1, colors='r')
+
+    ax.autoscale_view(scalex=False)
+
+
+  # Largest-Triangle-Three-Buckets downsampling of each column of y
+  # returns x and y of shape (n_out, n_col).
+  def downsample_lttb(self, y, n_out):
+    n, n_col = y.shape
+    if n_out >= n or n_out < 3:
+      x = np.repeat(np.arange(n)[:, None], n_col, axis=1)
+      return x, y
+
+    every = (n - 2) / (n_out - 2)
+    cols = np.arange(n_col)
+    x_out = np.zeros((n_out, n_col), dtype=int)
+    x_out[-1] = n - 1
+    a = np.zeros(n_col, dtype=int)   # selected point of previous bucket
+
+    for b in range(n_out - 2):
+      start = int(b * every) + 1
+      end = int((b + 1) * every) + 1
+      next_end = min(int((b + 2) * every) + 1, n)
+
+      # average point of next bucket
+      avg_x = (end + next_end - 1) / 2
+      avg_y = np.mean(y[end:next_end], axis=0)
+
+      # select point with largest triangle area in current bucket
+      a_x, a_y = a, y[a, cols]
+      xs = np.arange(start, end)[:, None]
+      area = np.abs((a_x - avg_x) * (y[start:end] - a_y)
+                    - (a_x - xs) * (avg_y - a_y))
+      a = start + np.argmax(area, axis=0)
+      x_out[b+1] = a
+
+    return x_out, y[x_out, cols]
+
+  # min/max bucket downsampling of each column of y
+  # returns x and y of shape (2 * n_bucket, n_col) in time order.
+  def downsample_minmax(self, y, n_out):
+    n, n_col = y.shape
+    n_bucket = n_out // 2
+    if n_bucket < 1 or 2 * n_bucket >= n:
+      x = np.repeat(np.arange(n)[:, None], n_col, axis=1)
+      return x, y
+
+    # uneven buckets covering every sample, shorter buckets repeat their
+    # last sample to fit a common size
+    edges = np.linspace(0, n, n_bucket + 1).astype(int)
+    size = np.max(np.diff(edges))
+    idx = np.minimum(edges[:-1, None] + np.arange(size), edges[1:, None] - 1)
+    cols = np.arange(n_col)
+    buckets = y[idx]
+    i_min = np.take_along_axis(idx, np.argmin(buckets, axis=1), axis=1)
+    i_max = np.take_along_axis(idx, np.argmax(buckets, axis=1), axis=1)
+
+    # keep each pair in time order
+    x_out = np.empty((2 * n_bucket, n_col), dtype=int)
+    x_out[0::2] = np.minimum(i_min, i_max)
+    x_out[1::2] = np.maximum(i_min, i_max)
 
+    return x_out, y[x_out, cols]
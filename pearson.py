@@ -41,6 +41,18 @@ class Pearson():
 
     return output_list
 
+  # pearson correlation coefficient between series and event time series
+  # with ddof = 0 for covariance and std, used by CETS screen.
+  # series may be 2-D, then coefficient of each column is returned.
+  # 0 when series or event time series is constant.
+  @staticmethod
+  def pearson_coefficient(series, ev_ts):
+    cov = (ev_ts - np.mean(ev_ts)) @ (series - np.mean(series, axis=0)) / len(ev_ts)
+    std = np.std(series, axis=0) * np.std(ev_ts)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+      return np.where(std > 0, cov / std, 0)
+
   # actually test pearson correlation
   def pc_one_series_and_event(self, series, event):
     R = False
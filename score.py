@@ -162,6 +162,12 @@ class Scoring():
                 false_negative += 1
 
 
+  # recall cost of screen, i.e. fraction of labelled correlations which are
+  # screened out before the test. screen_output is CETS.screen_output.
+  def screen_recall_cost(self, screen_output):
+    screen = Scoring(self.interpret_label, self.correlat_type, screen_output)
+    return 1 - screen.recall()
+
   # calculate precision
   def precision(self):
     return self.tp / (self.tp + self.fp)
@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from cets import CETS
+from data_loader import DataLoader
+
+class AnalysisServer():
+  """
+    Long-running local CETS analysis service. Loaded machines are kept
+    warm in memory as CETS instances (normalized arrays, detected
+    sub-series lengths and DTW distance cache), so that a request only
+    pays for the two-sample tests themselves.
+
+    It speaks minimal HTTP/1.1 with JSON bodies over TCP or Unix socket.
+      GET  /health     : {"status": "ok", "machines": [loaded machines]}
+      POST /load       : {"machine": name}
+                         warm up a machine and return its sub-series lengths.
+      POST /correlate  : {"machine": name, "events": [t1, t2, ...],
+                          "dims": [d1, d2, ...] (optional, 1-based)}
+                         return which dims correlate with the event list.
+    Tests of each dimension are queued onto a worker pool.
+  """
+
+  def __init__(self, dataset_folder, category = 'test', workers = 4,
+                cets_params = None):
+    """
+      dataset_folder  : dataset folder for DataLoader.
+      category        : category of time series to load machines from.
+      workers         : number of workers running the tests.
+      cets_params     : keyword arguments passed to CETS (e.g. sub_len_max).
+    """
+    self.data_loader = DataLoader(dataset_folder)
+    self.category = category
+    self.cets_params = dict(cets_params or {})
+    self.cets_params.setdefault('cache_dist', True)
+    self.executor = ThreadPoolExecutor(max_workers=workers)
+    self.machines = {}    # warm CETS instance of each machine
+    self.load_locks = {}  # lock for each machine being loaded
+
+  # register an in-memory time series as a machine
+  def add_machine(self, machine, time_series):
+    self.machines[machine] = CETS([time_series], [[]], **self.cets_params)
+
+  # get warm CETS instance of a machine, loading it at first access
+  async def get_machine(self, machine):
+    if machine in self.machines:
+      return self.machines[machine]
+
+    # create lock only for machines which exist in the dataset
+    if not isinstance(machine, str):
+      raise TypeError('machine must be a string.')
+    if machine not in self.data_loader.list_machines(self.category):
+      raise FileNotFoundError('machine {0} not found in {1}.'.format(machine, self.category))
+    lock = self.load_locks.setdefault(machine, asyncio.Lock())
+    async with lock:
+      if machine not in self.machines:
+        loop = asyncio.get_running_loop()
+        ts = await loop.run_in_executor(self.executor,
+                  self.data_loader.load_time_series_of_machine,
+                  self.category, machine)
+        await loop.run_in_executor(self.executor, self.add_machine, machine, ts)
+
+    return self.machines[machine]
+
+  # test one dimension of a warm machine with an event list
+  def test_one_dim(self, cets, dim, event):
+    R, D, T = cets.cets_one_series_and_event(cets.time_series[0][:,dim],
+                                  list(event), cets.sub_length_list[0][dim],
+                                  (0, dim, cets.sub_length_list[0][dim]))
+    return [dim+1, bool(R), [bool(D[0]), bool(D[1])], int(T)]
+
+  # events of a dim whose front and rear sub-series fit in the series
+  # raise ValueError when too few events are left for the NN test.
+  def valid_events(self, cets, dim, event):
+    k = cets.sub_length_list[0][dim]
+    n = len(cets.time_series[0])
+    valid = [e for e in event if k <= e < n-k]
+
+    n_min = max(2, math.ceil((cets.r + 1) / 2))
+    if len(valid) < n_min:
+      raise ValueError('dim {0} needs at least {1} events in [{2}, {3}), got {4}.'
+                        .format(dim+1, n_min, k, n-k, len(valid)))
+
+    return valid
+
+  # answer which dims correlate with the event list
+  async def correlate(self, machine, events, dims = None):
+    cets = await self.get_machine(machine)
+    n_dim = cets.time_series[0].shape[1]
+    if dims is None:
+      dims = range(1, n_dim+1)
+
+    event = sorted(set(int(e) for e in events))
+    if len(event) == 0:
+      raise ValueError('events must not be empty.')
+    for d in dims:
+      if not isinstance(d, int) or d < 1 or d > n_dim:
+        raise ValueError('dims must be in [1, {0}].'.format(n_dim))
+    dim_events = [(d-1, self.valid_events(cets, d-1, event)) for d in dims]
+
+    loop = asyncio.get_running_loop()
+    result = await asyncio.gather(*[loop.run_in_executor(self.executor,
+                              self.test_one_dim, cets, dim, ev) for dim, ev in dim_events])
+
+    return {'machine': machine,
+            'correlated': [r[0] for r in result if r[1]],
+            'result': result}
+
+  # route a request to its handler
+  async def dispatch(self, method, path, body):
+    if method == 'GET' and path == '/health':
+      return 200, {'status': 'ok', 'machines': sorted(self.machines)}
+
+    if method == 'POST' and path == '/load':
+      cets = await self.get_machine(body['machine'])
+      return 200, {'machine': body['machine'],
+                   'sub_length': [int(k) for k in cets.sub_length_list[0]]}
+
+    if method == 'POST' and path == '/correlate':
+      return 200, await self.correlate(body['machine'], body['events'],
+                                       body.get('dims'))
+
+    return 404, {'error': 'unknown endpoint {0} {1}'.format(method, path)}
+
+  # handle one HTTP connection
+  async def handle(self, reader, writer):
+    try:
+      await self.respond(reader, writer)
+    finally:
+      writer.close()
+
+  # read one HTTP request and write its JSON response
+  async def respond(self, reader, writer):
+    try:
+      request_line = await reader.readline()
+      method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+      # read headers and body
+      length = 0
+      while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+          break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+          length = int(value.strip())
+      raw = await reader.readexactly(length) if length > 0 else b''
+
+      try:
+        body = json.loads(raw) if raw else {}
+        status, payload = await self.dispatch(method, path, body)
+      except (KeyError, ValueError, TypeError) as e:
+        status, payload = 400, {'error': '{0}: {1}'.format(type(e).__name__, e)}
+      except OSError as e:
+        status, payload = 404, {'error': str(e)}
+      except Exception as e:
+        status, payload = 500, {'error': '{0}: {1}'.format(type(e).__name__, e)}
+
+    except (ValueError, asyncio.IncompleteReadError):
+      status, payload = 400, {'error': 'malformed request'}
+
+    data = json.dumps(payload).encode()
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+              500: 'Internal Server Error'}[status]
+    writer.write('HTTP/1.1 {0} {1}\r\n'.format(status, reason).encode())
+    writer.write(b'Content-Type: application/json\r\n')
+    writer.write('Content-Length: {0}\r\n'.format(len(data)).encode())
+    writer.write(b'Connection: close\r\n\r\n')
+    writer.write(data)
+    await writer.drain()
+
+  # start serving on TCP (host, port) or on Unix socket path
+  async def start(self, host = '127.0.0.1', port = 8765, unix_path = None):
+    if unix_path is not None:
+      return await asyncio.start_unix_server(self.handle, path=unix_path)
+    return await asyncio.start_server(self.handle, host, port)
+
+  # serve until cancelled
+  async def serve_forever(self, host = '127.0.0.1', port = 8765, unix_path = None):
+    server = await self.start(host, port, unix_path)
+    async with server:
+      await server.serve_forever()
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Local CETS analysis service.')
+  parser.add_argument('--dataset', default='ServerMachineDataset')
+  parser.add_argument('--category', default='test')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--unix', default=None, help='serve on Unix socket path')
+  parser.add_argument('--workers', type=int, default=4)
+  parser.add_argument('--sub_len_max', type=int, default=200)
+  parser.add_argument('--sub_len_min', type=int, default=100)
+  parser.add_argument('--r', type=int, default=3)
+  parser.add_argument('--alpha', type=float, default=2.58)
+  args = parser.parse_args()
+
+  analysis_server = AnalysisServer(args.dataset, args.category, args.workers,
+                          {'sub_len_max': args.sub_len_max,
+                           'sub_len_min': args.sub_len_min,
+                           'r': args.r, 'alpha': args.alpha})
+  asyncio.run(analysis_server.serve_forever(args.host, args.port, args.unix))
@@ -0,0 +1,76 @@
+import io
+import contextlib
+
+import numpy as np
+import pytest
+
+from cets import CETS
+
+# machine with an effect on dim 2 right after each event of the first event list
+def make_cets(**params):
+  rng = np.random.RandomState(0)
+  ts = rng.rand(2000, 3)
+  for e in range(100, 1900, 100):
+    ts[e+1:e+20, 1] += 3
+  event_sequences = [[list(range(100, 1900, 100)), list(range(150, 1900, 150))]]
+
+  return CETS([ts], event_sequences, sub_length=20, **params)
+
+# run CETS quietly and return (R, T) of each dim and event
+def run_quietly(cets):
+  with contextlib.redirect_stdout(io.StringIO()):
+    output = cets.run_cets()
+  return [[(bool(o[0]), o[2]) for o in dim] for dim in output[0]]
+
+
+@pytest.mark.parametrize('bg_pool_size', [0, 30])
+def test_seeded_runs_are_reproducible(bg_pool_size):
+  assert run_quietly(make_cets(seed=0, bg_pool_size=bg_pool_size)) \
+          == run_quietly(make_cets(seed=0, bg_pool_size=bg_pool_size))
+
+
+@pytest.mark.parametrize('bg_pool_size', [0, 30])
+def test_seeded_results_do_not_depend_on_test_order(bg_pool_size):
+  A = list(range(100, 1900, 100))
+  B = list(range(150, 1900, 150))
+
+  def test(cets, event):
+    return cets.cets_one_series_and_event(cets.time_series[0][:,0], list(event),
+                                          20, (0, 0, 20))
+
+  cets_ab = make_cets(seed=0, bg_pool_size=bg_pool_size)
+  result_a, result_b = test(cets_ab, A), test(cets_ab, B)
+  cets_ba = make_cets(seed=0, bg_pool_size=bg_pool_size)
+  assert test(cets_ba, B) == result_b
+  assert test(cets_ba, A) == result_a
+
+
+def test_background_pool_distances_are_reused():
+  cets = make_cets(seed=0, bg_pool_size=30)
+  event = list(range(100, 1900, 100))
+  series = cets.time_series[0][:,0]
+  cets.cets_one_series_and_event(series, list(event), 20, (0, 0, 20))
+  pool, pool_dist = cets.bg_pools[(0, 0, 20)]
+
+  # count DTW distances computed for the next event list on the same pool
+  n_dist = [0]
+  dtw_distance = cets.dtw_distance
+  def counting_dtw_distance(x, y):
+    n_dist[0] += 1
+    return dtw_distance(x, y)
+  cets.dtw_distance = counting_dtw_distance
+
+  event = list(range(150, 1900, 150))
+  n = len(event)
+  cets.cets_one_series_and_event(series, list(event), 20, (0, 0, 20))
+
+  # only event-vs-event and event-vs-pool distances of front and rear
+  assert n_dist[0] == 2 * (n*(n-1)//2 + n*n)
+  assert cets.bg_pools[(0, 0, 20)][1] is pool_dist
+  assert list(cets.bg_pools) == [(0, 0, 20)]
+
+
+def test_background_pool_smaller_than_events_raises():
+  cets = make_cets(seed=0, bg_pool_size=5)
+  with pytest.raises(ValueError):
+    run_quietly(cets)
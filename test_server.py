@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import numpy as np
+
+from server import AnalysisServer
+
+# send one HTTP request to the server and return (status, json body)
+async def request(port, method, path, body = None):
+  reader, writer = await asyncio.open_connection('127.0.0.1', port)
+  data = json.dumps(body).encode() if body is not None else b''
+  writer.write('{0} {1} HTTP/1.1\r\nContent-Length: {2}\r\n\r\n'
+                .format(method, path, len(data)).encode() + data)
+  await writer.drain()
+  response = await reader.read()
+  writer.close()
+
+  head, _, payload = response.decode().partition('\r\n\r\n')
+  return int(head.split(' ')[1]), json.loads(payload)
+
+
+def test_round_trip_on_localhost(tmp_path):
+  # machine with an effect on dim 2 right after each event
+  rng = np.random.RandomState(0)
+  ts = rng.rand(2000, 3)
+  events = list(range(100, 1900, 100))
+  for e in events:
+    ts[e+1:e+20, 1] += 3
+  (tmp_path / 'test').mkdir()
+  np.savetxt(tmp_path / 'test' / 'm.txt', ts, delimiter=',')
+  (tmp_path / 'secret.txt').write_text('1,2,3\n')
+
+  async def run():
+    server = AnalysisServer(str(tmp_path), 'test', workers=2,
+                            cets_params={'sub_length': 20, 'seed': 0})
+    srv = await server.start(port=0)
+    port = srv.sockets[0].getsockname()[1]
+
+    try:
+      status, body = await request(port, 'GET', '/health')
+      assert status == 200 and body['machines'] == []
+
+      status, body = await request(port, 'POST', '/load', {'machine': 'm'})
+      assert status == 200 and body['sub_length'] == [20, 20, 20]
+
+      status, body = await request(port, 'POST', '/correlate',
+                                    {'machine': 'm', 'events': events})
+      assert status == 200 and body['correlated'] == [2]
+
+      status, body = await request(port, 'POST', '/correlate',
+                                    {'machine': 'm', 'events': events, 'dims': [1]})
+      assert status == 200 and [r[0] for r in body['result']] == [1]
+
+      # events too close to the boundary or too few
+      status, _ = await request(port, 'POST', '/correlate',
+                                  {'machine': 'm', 'events': [5]})
+      assert status == 400
+      status, _ = await request(port, 'POST', '/correlate',
+                                  {'machine': 'm', 'events': []})
+      assert status == 400
+
+      status, _ = await request(port, 'POST', '/correlate',
+                                  {'machine': 'm', 'events': events, 'dims': [4]})
+      assert status == 400
+      status, _ = await request(port, 'POST', '/correlate', {'events': events})
+      assert status == 400
+
+      # machines outside the category folder
+      status, _ = await request(port, 'POST', '/load', {'machine': '../secret'})
+      assert status == 404
+      status, _ = await request(port, 'POST', '/load', {'machine': 'nope'})
+      assert status == 404
+      assert sorted(server.load_locks) == ['m']
+
+      status, _ = await request(port, 'GET', '/unknown')
+      assert status == 404
+
+      # unexpected errors are answered with 500
+      def fail(*args):
+        raise RuntimeError('boom')
+      server.test_one_dim = fail
+      status, body = await request(port, 'POST', '/correlate',
+                                    {'machine': 'm', 'events': events})
+      assert status == 500 and 'RuntimeError' in body['error']
+
+      status, body = await request(port, 'GET', '/health')
+      assert body['machines'] == ['m']
+    finally:
+      srv.close()
+      await srv.wait_closed()
+
+  asyncio.run(run())